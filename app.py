@@ -9,15 +9,19 @@ import streamlit as st
 import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from download_podcasts import (
     fetch_rss_feed,
     extract_episode_links,
-    extract_shiur_id,
     get_mp3_url_from_page,
-    load_downloaded_shiurim,
+    load_download_database,
     save_downloaded_shiurim,
     sanitize_filename,
-    session
+    write_json_atomic,
+    mp3_session,
+    RSS_HTTP_CACHE,
+    RateLimiter
 )
 import google_drive_auth as gd
 import streamlit_cookies_manager as cookies
@@ -27,9 +31,19 @@ FEEDS_CONFIG_FILE = 'rss_feeds.json'
 
 # Default feeds
 DEFAULT_FEEDS = {
-    "Rav Moshe Taragin": "http://www.yutorah.org/rss/RssAudioOnly/teacher/80307",
+    "Rav Moshe Taragin": "https://www.yutorah.org/rss/RssAudioOnly/teacher/80307",
 }
 
+# Attempts per MP3 download before giving up
+DOWNLOAD_ATTEMPTS = 4
+
+# Longest Retry-After (seconds) honoured between download attempts, so a
+# throttled server can't stall a worker for minutes
+MAX_RETRY_AFTER = 60
+
+# Upper bound on parallel downloads (Drive allows ~10 writes/sec per user)
+MAX_DOWNLOAD_WORKERS = 8
+
 
 def apply_custom_styles():
     """Apply a minimal visual system for spacing and section cards."""
@@ -46,16 +60,6 @@ def apply_custom_styles():
                 margin-bottom: 0.8rem;
                 background: rgba(250, 250, 250, 0.35);
             }
-            .status-pill {
-                display: inline-block;
-                padding: 0.15rem 0.5rem;
-                border-radius: 999px;
-                font-size: 0.78rem;
-                line-height: 1.4;
-                border: 1px solid rgba(128, 128, 128, 0.35);
-            }
-            .status-new {background: rgba(76, 175, 80, 0.12); color: #1b5e20;}
-            .status-unknown {background: rgba(128, 128, 128, 0.12); color: #37474f;}
             .sticky-progress {
                 position: sticky;
                 top: 0.5rem;
@@ -73,11 +77,7 @@ def apply_custom_styles():
     )
 
 
-def status_pill(label, css_class):
-    return f"<span class='status-pill {css_class}'>{label}</span>"
-
-
-def download_and_upload_to_drive(mp3_url, title, folder_id, shiur_id=None):
+def download_and_upload_to_drive(mp3_url, title, folder_id, shiur_id=None, limiter=None):
     """
     Download MP3 file and upload to Google Drive.
 
@@ -86,6 +86,7 @@ def download_and_upload_to_drive(mp3_url, title, folder_id, shiur_id=None):
         title: Title of the episode
         folder_id: Google Drive folder ID to upload to
         shiur_id: Optional shiur ID to store in file description for tracking
+        limiter: Optional RateLimiter each retry takes a token from
 
     Returns:
         Dictionary with file info or None
@@ -94,27 +95,41 @@ def download_and_upload_to_drive(mp3_url, title, folder_id, shiur_id=None):
         # Sanitize filename
         filename = sanitize_filename(title) + '.mp3'
 
-        # Download the file content with a couple retries for transient failures
+        # Download the file content with a few retries for transient failures,
+        # backing off exponentially (and honouring Retry-After when throttled)
         last_error = None
         response = None
-        for attempt in range(3):
+        for attempt in range(DOWNLOAD_ATTEMPTS):
             try:
-                response = session.get(mp3_url, stream=True, timeout=60)
+                response = mp3_session.get(mp3_url, stream=True, timeout=60)
                 response.raise_for_status()
                 break
             except Exception as e:
                 last_error = e
-                if attempt < 2:
-                    time.sleep(1.5 * (attempt + 1))
+                retry_after = None
+                if response is not None:
+                    if response.status_code == 429:
+                        retry_after = response.headers.get('Retry-After')
+                    response.close()
+                    response = None
+                if attempt < DOWNLOAD_ATTEMPTS - 1:
+                    backoff = 1.5 * (2 ** attempt)
+                    if retry_after and retry_after.isdigit():
+                        backoff = max(backoff, min(int(retry_after), MAX_RETRY_AFTER))
+                    time.sleep(backoff)
+                    if limiter:
+                        limiter.acquire()
 
         if response is None:
             raise RuntimeError(f"Failed to download MP3 after retries: {last_error}")
 
-        # Read content into memory
-        file_content = b''
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                file_content += chunk
+        # Stream the response body straight into the Drive upload. Its length
+        # is only known up front if the body isn't compressed in transit.
+        response.raw.decode_content = True
+        size = None
+        if response.headers.get('Content-Length', '').isdigit() and \
+                response.headers.get('Content-Encoding', 'identity') == 'identity':
+            size = int(response.headers['Content-Length'])
 
         # Prepare description with shiur ID for tracking
         description = None
@@ -122,13 +137,16 @@ def download_and_upload_to_drive(mp3_url, title, folder_id, shiur_id=None):
             description = f"shiurID:{shiur_id}"
 
         # Upload to Google Drive
-        file_info = gd.upload_file_to_drive(
-            file_content,
-            filename,
-            folder_id=folder_id,
-            mime_type='audio/mpeg',
-            description=description
-        )
+        with response:
+            file_info = gd.upload_file_to_drive(
+                response.raw,
+                filename,
+                folder_id=folder_id,
+                mime_type='audio/mpeg',
+                description=description,
+                size=size,
+                app_properties={gd.SHIUR_ID_PROPERTY: str(shiur_id)} if shiur_id else None
+            )
 
         return file_info
 
@@ -137,9 +155,97 @@ def download_and_upload_to_drive(mp3_url, title, folder_id, shiur_id=None):
         return None
 
 
-def load_feeds_config():
-    """Load RSS feeds configuration from file."""
-    if os.path.exists(FEEDS_CONFIG_FILE):
+def _process_episode(title, page_url, shiur_id, target_folder_id, limiter):
+    """
+    Resolve one episode's MP3 and upload it to Drive. Runs in a worker thread.
+
+    Returns:
+        Dictionary with 'ok', 'shiur_id' and a human-readable 'message'
+    """
+    limiter.acquire()
+    episode_data = get_mp3_url_from_page(page_url)
+
+    if not episode_data or not episode_data.get('downloadURL'):
+        failure_reason = (episode_data or {}).get('failure_reason', 'unknown reason')
+        return {
+            'ok': False,
+            'shiur_id': shiur_id,
+            'message': f"Could not find an MP3 link for '{title[:42]}': {failure_reason}.",
+        }
+
+    mp3_url = episode_data['downloadURL']
+    actual_shiur_id = str(episode_data.get('shiurID')) if episode_data.get('shiurID') else shiur_id
+
+    limiter.acquire()
+    file_info = download_and_upload_to_drive(mp3_url, title, target_folder_id, actual_shiur_id, limiter)
+
+    if not file_info:
+        return {
+            'ok': False,
+            'shiur_id': actual_shiur_id,
+            'message': "Upload failed. This can happen if Drive permissions expire.",
+        }
+
+    return {
+        'ok': True,
+        'shiur_id': actual_shiur_id,
+        'message': f"Saved: {file_info.get('name', title)[:48]}",
+    }
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_feed_episodes(rss_url):
+    """
+    Fetch and parse a feed, cached for five minutes across reruns.
+
+    Returns:
+        List of (title, page_url, shiur_id) tuples
+    """
+    rss_content = fetch_rss_feed(rss_url, cache=RSS_HTTP_CACHE)
+    try:
+        return extract_episode_links(rss_content)
+    except Exception:
+        # Forget the unparseable body so a 304 can't keep serving it; the
+        # error itself isn't cached by st.cache_data
+        RSS_HTTP_CACHE.pop(rss_url, None)
+        raise
+
+
+def _file_mtime(path):
+    """Modification time of `path`, or 0.0 if it doesn't exist, from one stat call."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+# cache_resource hands back the same dict to every session and rerun instead
+# of a copy, so callers must treat it as read-only; a save changes the file's
+# mtime, which loads a fresh copy on the next rerun.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _load_download_database_cached(db_file, mtime):
+    """Cached load_download_database; `mtime` keys the cache to the file's contents."""
+    return load_download_database(db_file)
+
+
+def get_download_database(db_file):
+    """
+    Load the local download database, re-reading it only when the file changes.
+
+    Args:
+        db_file: Path to the JSON database file
+
+    Returns:
+        Dictionary with 'downloaded_shiurim' and 'last_updated'
+    """
+    mtime = _file_mtime(db_file)
+    return _load_download_database_cached(db_file, mtime)
+
+
+@st.cache_data(show_spinner=False)
+def _load_feeds_config_cached(mtime):
+    """Parse the feeds file; `mtime` keys the cache to the file's contents."""
+    if mtime:
         try:
             with open(FEEDS_CONFIG_FILE, 'r', encoding='utf-8') as f:
                 return json.load(f)
@@ -148,47 +254,29 @@ def load_feeds_config():
     return DEFAULT_FEEDS.copy()
 
 
+def load_feeds_config():
+    """Load RSS feeds configuration from file, re-reading it only when it changes."""
+    mtime = _file_mtime(FEEDS_CONFIG_FILE)
+    return _load_feeds_config_cached(mtime)
+
+
 def save_feeds_config(feeds):
     """Save RSS feeds configuration to file."""
     try:
-        with open(FEEDS_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(feeds, f, indent=2)
+        write_json_atomic(FEEDS_CONFIG_FILE, feeds, indent=2)
+        _load_feeds_config_cached.clear()
     except Exception as e:
         st.error(f"Error saving feeds configuration: {e}")
 
 
-def main():
-    st.set_page_config(
-        page_title="YUTorah Podcast Downloader",
-        page_icon="🎧",
-        layout="wide"
-    )
-
-    # Initialize cookie manager for persistent authentication
-    cookie_manager = cookies.CookieManager()
-    gd.set_cookie_manager(cookie_manager)
-
-    # Wait for cookie manager to be ready
-    if not cookie_manager.ready():
-        st.stop()
-
-    # Initialize authentication from cookies
-    gd.init_auth_from_cookies()
-
-    apply_custom_styles()
-
-    st.title("YUTorah Podcast Downloader")
-    st.caption("Download shiurim from YUTorah RSS feeds")
-
-    # Initialize session state
-    if 'new_episodes' not in st.session_state:
-        st.session_state.new_episodes = []
-    if 'selected_episodes' not in st.session_state:
-        st.session_state.selected_episodes = {}
-    if 'feed_checked' not in st.session_state:
-        st.session_state.feed_checked = False
+def render_sidebar():
+    """
+    Render the settings sidebar.
 
-    # Sidebar for configuration
+    Returns:
+        Dictionary of the chosen settings: feeds, feed_name, safe_feed_name,
+        drive_base_folder, use_subfolders, delay, max_workers and db_file
+    """
     with st.sidebar:
         st.header("Settings")
 
@@ -211,6 +299,10 @@ def main():
             else:
                 st.success("Signed in to Google Drive")
 
+            if st.button("Refresh Drive cache", use_container_width=True,
+                         help="Re-list Drive folders instead of reusing recent results"):
+                gd.clear_uploaded_shiur_ids_cache()
+
             if st.button("Sign out", use_container_width=True):
                 gd.sign_out()
                 st.rerun()
@@ -281,38 +373,42 @@ def main():
                 value="YUTorah Podcasts",
                 help="Main folder in Google Drive for podcasts"
             )
-
-            use_subfolders = st.checkbox(
-                "Use feed-specific subfolders",
-                value=True,
-                help="Create a subfolder for each feed"
-            )
         else:
             st.warning("Files will be saved to this server (not recommended)")
             st.caption("Please sign in to Google Drive to save files to your account")
 
-            output_base_dir = st.text_input(
+            st.text_input(
                 "Base Output Directory",
                 value="downloads",
                 help="Base directory where feed subfolders will be created",
                 disabled=True
             )
 
-            use_subfolders = st.checkbox(
-                "Use feed-specific subfolders",
-                value=True,
-                help="Create a subfolder for each feed"
-            )
-
             drive_base_folder = None
 
+        use_subfolders = st.checkbox(
+            "Use feed-specific subfolders",
+            value=True,
+            help="Create a subfolder for each feed"
+        )
+
         delay = st.slider(
-            "Delay Between Downloads (seconds)",
+            "Seconds Between Requests",
             min_value=0.5,
             max_value=5.0,
             value=1.0,
             step=0.5,
-            help="Time to wait between downloads"
+            help="Minimum seconds between requests to YUTorah. Each episode makes "
+                 "two (its page and its MP3), and parallel downloads may start "
+                 "together at first"
+        )
+
+        max_workers = st.slider(
+            "Parallel Downloads",
+            min_value=1,
+            max_value=MAX_DOWNLOAD_WORKERS,
+            value=4,
+            help="Number of episodes to download and upload at the same time"
         )
 
         # Only show local database option when not using Google Drive
@@ -325,7 +421,23 @@ def main():
         else:
             db_file = "downloaded_shiurim.json"  # Default value, but not used
 
-    # Main content area
+    return {
+        'feeds': feeds,
+        'feed_name': feed_name,
+        'safe_feed_name': sanitize_filename(feed_name) if feed_name else None,
+        'drive_base_folder': drive_base_folder,
+        'use_subfolders': use_subfolders,
+        'delay': delay,
+        'max_workers': max_workers,
+        'db_file': db_file,
+    }
+
+
+def render_overview(settings, download_db):
+    """Render the selected feed and the diagnostics panel."""
+    feed_name = settings['feed_name']
+    feeds = settings['feeds']
+
     st.markdown("<div class='section-card'>", unsafe_allow_html=True)
     col1, col2 = st.columns([2, 1])
 
@@ -340,212 +452,297 @@ def main():
         if gd.is_authenticated():
             st.caption("Drive sync is enabled.")
         else:
-            downloaded_shiurim = load_downloaded_shiurim(db_file)
-            st.metric("Local history", len(downloaded_shiurim))
-            if os.path.exists(db_file):
-                try:
-                    with open(db_file, 'r') as f:
-                        data = json.load(f)
-                        last_updated = data.get('last_updated', 'Never')
-                        st.caption(f"Last updated: {last_updated}")
-                except:
-                    pass
+            st.metric("Local history", len(download_db['downloaded_shiurim']))
+            if download_db['last_updated']:
+                st.caption(f"Last updated: {download_db['last_updated']}")
     st.markdown("</div>", unsafe_allow_html=True)
 
-    st.markdown("<div class='section-card'>", unsafe_allow_html=True)
-    st.subheader("Downloads")
 
-    # Check for episodes button
-    if st.button("Check for new episodes", type="primary", use_container_width=True):
-        if feed_name not in feeds:
-            st.error("Please select a valid feed.")
-            return
+def resolve_drive_folders(settings):
+    """
+    Resolve the Drive base folder and the folder episodes are saved to.
 
-        rss_url = feeds[feed_name]
-        status_text = st.empty()
+    Folder IDs are memoized by google_drive_auth, so after the first call
+    this costs no Drive requests for the rest of the session.
 
-        try:
-            status_text.text("Fetching feed...")
-            rss_root = fetch_rss_feed(rss_url)
+    Args:
+        settings: Settings dictionary from render_sidebar()
 
-            status_text.text("Reading episodes...")
-            episodes = extract_episode_links(rss_root)
+    Returns:
+        Tuple of (base_folder_id, target_folder_id); either may be None,
+        a None target meaning the Drive root (or a failed lookup)
+    """
+    drive_base_folder = settings['drive_base_folder']
+    base_folder_id = gd.find_or_create_folder(drive_base_folder) if drive_base_folder else None
+    if drive_base_folder and not base_folder_id:
+        return None, None
+
+    if settings['use_subfolders']:
+        target_folder_id = gd.find_or_create_folder(settings['safe_feed_name'], base_folder_id)
+    else:
+        target_folder_id = base_folder_id
+    return base_folder_id, target_folder_id
+
+
+def check_for_new_episodes(settings, downloaded_shiurim):
+    """
+    Fetch the selected feed and store the episodes not yet downloaded in
+    st.session_state.new_episodes.
+    """
+    feed_name = settings['feed_name']
+    feeds = settings['feeds']
+    drive_base_folder = settings['drive_base_folder']
+
+    if feed_name not in feeds:
+        st.error("Please select a valid feed.")
+        return
 
-            if not episodes:
-                st.info("No episodes were found in this feed right now.")
-                return
+    rss_url = feeds[feed_name]
+    status_text = st.empty()
+
+    try:
+        status_text.text("Fetching feed...")
+
+        # Fetch the feed in the background while Drive history is looked up
+        with ThreadPoolExecutor(
+            max_workers=1,
+            initializer=add_script_run_ctx,
+            initargs=(None, get_script_run_ctx())
+        ) as executor:
+            episodes_future = executor.submit(fetch_feed_episodes, rss_url)
 
             uploaded_shiur_ids = set()
 
             if gd.is_authenticated() and drive_base_folder:
                 status_text.text("Checking your Drive history...")
-                base_folder_id = gd.find_or_create_folder(drive_base_folder)
-                if base_folder_id:
-                    if use_subfolders:
-                        safe_feed_name = sanitize_filename(feed_name)
-                        check_folder_id = gd.find_or_create_folder(safe_feed_name, base_folder_id)
-                    else:
-                        check_folder_id = base_folder_id
-
-                    if check_folder_id:
-                        uploaded_shiur_ids = gd.get_uploaded_shiur_ids(check_folder_id)
-                        st.session_state.target_folder_id = check_folder_id
+                _, check_folder_id = resolve_drive_folders(settings)
+                if check_folder_id:
+                    uploaded_shiur_ids = gd.get_uploaded_shiur_ids(check_folder_id)
             else:
-                uploaded_shiur_ids = load_downloaded_shiurim(db_file)
+                uploaded_shiur_ids = downloaded_shiurim
 
-            new_episodes = []
-            for title, page_url in episodes:
-                shiur_id = extract_shiur_id(page_url)
-                if shiur_id and shiur_id in uploaded_shiur_ids:
-                    continue
-                new_episodes.append((title, page_url, shiur_id))
-
-            st.session_state.new_episodes = new_episodes
-            st.session_state.feed_checked = True
-            st.session_state.selected_episodes = {i: True for i in range(len(new_episodes))}
+            status_text.text("Reading episodes...")
+            episodes = episodes_future.result()
 
+        if not episodes:
             status_text.empty()
-            st.success(f"Found {len(new_episodes)} new episodes out of {len(episodes)} total.")
+            st.info("No episodes were found in this feed right now.")
+            return
 
-        except Exception as e:
-            st.error("We couldn't finish checking the feed. Please try again in a minute.")
-            st.caption(f"Details: {e}")
+        new_episodes = [
+            episode for episode in episodes
+            if not (episode[2] and episode[2] in uploaded_shiur_ids)
+        ]
 
-    if st.session_state.feed_checked and st.session_state.new_episodes:
-        st.markdown(f"{len(st.session_state.new_episodes)} episodes are available.")
+        st.session_state.new_episodes = new_episodes
+        st.session_state.feed_checked = True
+        st.session_state.selected_episodes = {i: True for i in range(len(new_episodes))}
 
-        if 'selection_state_version' not in st.session_state:
-            st.session_state.selection_state_version = 0
+        status_text.empty()
+        st.success(f"Found {len(new_episodes)} new episodes out of {len(episodes)} total.")
 
-        col1, col2 = st.columns([1, 1])
-        with col1:
-            if st.button("Select all", key=f"select_all_{st.session_state.selection_state_version}"):
-                for i in range(len(st.session_state.new_episodes)):
-                    st.session_state.selected_episodes[i] = True
-                st.session_state.selection_state_version += 1
-                st.rerun()
-        with col2:
-            if st.button("Clear selection", key=f"deselect_all_{st.session_state.selection_state_version}"):
-                for i in range(len(st.session_state.new_episodes)):
-                    st.session_state.selected_episodes[i] = False
-                st.session_state.selection_state_version += 1
-                st.rerun()
+    except Exception as e:
+        st.error("We couldn't finish checking the feed. Please try again in a minute.")
+        st.caption(f"Details: {e}")
 
-        head_cols = st.columns([0.08, 0.58, 0.14, 0.2])
-        head_cols[0].markdown("**Pick**")
-        head_cols[1].markdown("**Title**")
-        head_cols[2].markdown("**shiurID**")
-        head_cols[3].markdown("**Status / Action**")
-
-        for i, (title, page_url, shiur_id) in enumerate(st.session_state.new_episodes):
-            if i not in st.session_state.selected_episodes:
-                st.session_state.selected_episodes[i] = True
-
-            row_cols = st.columns([0.08, 0.58, 0.14, 0.2])
-            selected = row_cols[0].checkbox(
-                "Select",
-                value=st.session_state.selected_episodes[i],
-                key=f"episode_{i}_v{st.session_state.selection_state_version}",
-                label_visibility="collapsed"
-            )
-            st.session_state.selected_episodes[i] = selected
-            row_cols[1].markdown(title)
-            row_cols[1].caption(page_url)
-            row_cols[2].markdown(str(shiur_id) if shiur_id else "—")
-            row_cols[3].markdown(status_pill("New", "status-new") if shiur_id else status_pill("ID missing", "status-unknown"), unsafe_allow_html=True)
-
-        selected_count = sum(1 for v in st.session_state.selected_episodes.values() if v)
-        if st.button(f"Download selected ({selected_count})", type="primary", use_container_width=True, disabled=selected_count == 0):
-            if not gd.is_authenticated():
-                st.error("Please sign in to Google Drive first so files can be saved safely.")
-                st.stop()
-
-            base_folder_id = None
-            target_folder_id = None
-
-            if drive_base_folder:
-                base_folder_id = gd.find_or_create_folder(drive_base_folder)
-                if not base_folder_id:
-                    st.error("We couldn't access your main Drive folder. Please verify folder permissions and try again.")
-                    st.stop()
-
-                if use_subfolders:
-                    safe_feed_name = sanitize_filename(feed_name)
-                    target_folder_id = gd.find_or_create_folder(safe_feed_name, base_folder_id)
-                else:
-                    target_folder_id = base_folder_id
-            else:
-                if use_subfolders:
-                    safe_feed_name = sanitize_filename(feed_name)
-                    target_folder_id = gd.find_or_create_folder(safe_feed_name)
 
-            st.caption(f"Destination: {drive_base_folder or 'Drive root'}")
+def render_episode_selection():
+    """
+    Render the new-episode list as a grid with a pick column.
 
-            st.markdown("<div class='sticky-progress'>", unsafe_allow_html=True)
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            st.markdown("</div>", unsafe_allow_html=True)
-            log_container = st.container()
+    Returns:
+        Number of episodes currently selected
+    """
+    st.markdown(f"{len(st.session_state.new_episodes)} episodes are available.")
 
-            successful = 0
-            failed = 0
-            event_log = []
+    if 'selection_state_version' not in st.session_state:
+        st.session_state.selection_state_version = 0
 
-            selected_episodes = [
-                (i, ep) for i, ep in enumerate(st.session_state.new_episodes)
-                if st.session_state.selected_episodes.get(i, False)
-            ]
+    # The grid is drawn below these buttons, so it already picks up the new
+    # selection in this run; no extra st.rerun() is needed.
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        if st.button("Select all", key="select_all"):
+            st.session_state.selected_episodes = dict.fromkeys(range(len(st.session_state.new_episodes)), True)
+            st.session_state.selection_state_version += 1
+    with col2:
+        if st.button("Clear selection", key="deselect_all"):
+            st.session_state.selected_episodes = dict.fromkeys(range(len(st.session_state.new_episodes)), False)
+            st.session_state.selection_state_version += 1
+
+    # One editable grid instead of a row of widgets per episode
+    rows = [
+        {
+            'pick': st.session_state.selected_episodes.get(i, True),
+            'title': title,
+            'shiur_id': str(shiur_id) if shiur_id else "—",
+            'status': "New" if shiur_id else "ID missing",
+            'page_url': page_url,
+        }
+        for i, (title, page_url, shiur_id) in enumerate(st.session_state.new_episodes)
+    ]
+    edited_rows = st.data_editor(
+        rows,
+        column_config={
+            'pick': st.column_config.CheckboxColumn("Pick"),
+            'title': st.column_config.TextColumn("Title", width="large"),
+            'shiur_id': st.column_config.TextColumn("shiurID"),
+            'status': st.column_config.TextColumn("Status"),
+            'page_url': st.column_config.LinkColumn("Page"),
+        },
+        disabled=['title', 'shiur_id', 'status', 'page_url'],
+        hide_index=True,
+        use_container_width=True,
+        key=f"episode_grid_v{st.session_state.selection_state_version}"
+    )
+    st.session_state.selected_episodes = {i: row['pick'] for i, row in enumerate(edited_rows)}
 
-            for idx, (i, (title, page_url, shiur_id)) in enumerate(selected_episodes):
-                progress = (idx + 1) / len(selected_episodes)
-                progress_bar.progress(progress)
-                status_text.text(f"Processing {idx+1}/{len(selected_episodes)}")
+    return sum(st.session_state.selected_episodes.values())
 
-                episode_data = get_mp3_url_from_page(page_url)
 
-                if not episode_data or not episode_data.get('downloadURL'):
-                    failed += 1
-                    failure_reason = (episode_data or {}).get('failure_reason', 'unknown reason')
-                    event_log.append(f"Could not find an MP3 link for '{title[:42]}': {failure_reason}.")
-                else:
-                    mp3_url = episode_data['downloadURL']
-                    actual_shiur_id = str(episode_data.get('shiurID')) if episode_data.get('shiurID') else shiur_id
-                    file_info = download_and_upload_to_drive(mp3_url, title, target_folder_id, actual_shiur_id)
+def download_selected_episodes(settings, downloaded_shiurim):
+    """Download the selected episodes to Drive and report the results."""
+    if not gd.is_authenticated():
+        st.error("Please sign in to Google Drive first so files can be saved safely.")
+        st.stop()
+
+    drive_base_folder = settings['drive_base_folder']
+    db_file = settings['db_file']
+
+    base_folder_id, target_folder_id = resolve_drive_folders(settings)
+    if drive_base_folder and not base_folder_id:
+        st.error("We couldn't access your main Drive folder. Please verify folder permissions and try again.")
+        st.stop()
+
+    st.caption(f"Destination: {drive_base_folder or 'Drive root'}")
+
+    st.markdown("<div class='sticky-progress'>", unsafe_allow_html=True)
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    st.markdown("</div>", unsafe_allow_html=True)
+    log_placeholder = st.empty()
+
+    successful = 0
+    failed = 0
+    event_log = []
+
+    selected_episodes = [
+        (i, ep) for i, ep in enumerate(st.session_state.new_episodes)
+        if st.session_state.selected_episodes.get(i, False)
+    ]
+
+    limiter = RateLimiter(1 / settings['delay'], capacity=settings['max_workers'])
+    ctx = get_script_run_ctx()
+
+    # Uploaded IDs not yet in the database. downloaded_shiurim is shared by
+    # every session through cache_resource, so it is only read here; the save
+    # changes the file's mtime and the next rerun loads the new set.
+    new_shiurim = set()
+
+    def record_result(result):
+        """Note a successful upload's shiur ID for the Drive cache and the database."""
+        shiur_id = str(result['shiur_id']) if result['shiur_id'] else None
+        if shiur_id:
+            gd.record_uploaded_shiur_id(target_folder_id, shiur_id)
+            if shiur_id not in downloaded_shiurim:
+                new_shiurim.add(shiur_id)
+
+    # Write the database once at the end (also when the run is stopped
+    # midway) rather than re-serializing it after every episode
+    try:
+        with ThreadPoolExecutor(
+            max_workers=settings['max_workers'],
+            initializer=add_script_run_ctx,
+            initargs=(None, ctx)
+        ) as executor:
+            futures = [
+                executor.submit(_process_episode, title, page_url, shiur_id, target_folder_id, limiter)
+                for i, (title, page_url, shiur_id) in selected_episodes
+            ]
+
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    progress_bar.progress(done / len(selected_episodes))
+                    status_text.text(f"Processed {done}/{len(selected_episodes)}")
 
-                    if file_info:
+                    if result['ok']:
                         successful += 1
-                        event_log.append(f"Saved: {file_info.get('name', title)[:48]}")
-                        if actual_shiur_id:
-                            downloaded_shiurim = load_downloaded_shiurim(db_file)
-                            downloaded_shiurim.add(str(actual_shiur_id))
-                            save_downloaded_shiurim(db_file, downloaded_shiurim)
+                        record_result(result)
                     else:
                         failed += 1
-                        event_log.append("Upload failed. This can happen if Drive permissions expire.")
-
-                with log_container:
-                    st.markdown("#### Recent events")
-                    for entry in event_log[-8:]:
-                        st.markdown(f"<div class='event-log'>• {entry}</div>", unsafe_allow_html=True)
+                    event_log.append(result['message'])
+
+                    # Redraw the log as one element instead of appending per entry
+                    log_placeholder.markdown(
+                        "#### Recent events\n" + "".join(
+                            f"<div class='event-log'>• {entry}</div>" for entry in event_log[-8:]
+                        ),
+                        unsafe_allow_html=True
+                    )
+            except BaseException:
+                # Stopped, or a widget triggered a rerun: drop queued episodes,
+                # let the in-flight ones finish, and keep what they uploaded so
+                # a re-check doesn't offer them again
+                executor.shutdown(wait=True, cancel_futures=True)
+                for future in futures:
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        result = future.result()
+                        if result['ok']:
+                            record_result(result)
+                raise
+    finally:
+        if new_shiurim:
+            save_downloaded_shiurim(db_file, downloaded_shiurim | new_shiurim)
+
+    progress_bar.progress(1.0)
+    status_text.text("Done")
+
+    st.success("Download run finished.")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total", len(selected_episodes))
+    col2.metric("Successful", successful)
+    col3.metric("Failed", failed)
+
+    if failed:
+        st.warning("Some episodes failed. See Recent events for per-episode error reasons (missing MP3 source, network timeout, or Drive permission expiry).")
+
+    st.session_state.new_episodes = []
+    st.session_state.selected_episodes = {}
+    st.session_state.feed_checked = False
+
+
+@st.fragment
+def render_episode_picker(settings, downloaded_shiurim):
+    """
+    Render the episode grid and download button as a fragment, so ticking
+    episodes reruns only this section instead of the whole page.
+    """
+    selected_count = render_episode_selection()
+    if st.button(f"Download selected ({selected_count})", type="primary", use_container_width=True, disabled=selected_count == 0):
+        download_selected_episodes(settings, downloaded_shiurim)
 
-                if idx < len(selected_episodes) - 1:
-                    time.sleep(delay)
 
-            progress_bar.progress(1.0)
-            status_text.text("Done")
+def render_downloads(settings, downloaded_shiurim):
+    """Render the check / select / download section."""
+    st.markdown("<div class='section-card'>", unsafe_allow_html=True)
+    st.subheader("Downloads")
 
-            st.success("Download run finished.")
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Total", len(selected_episodes))
-            col2.metric("Successful", successful)
-            col3.metric("Failed", failed)
+    # Check for episodes button
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        check_clicked = st.button("Check for new episodes", type="primary", use_container_width=True)
+    with col2:
+        refresh_clicked = st.button("Force refresh", use_container_width=True,
+                                    help="Re-fetch the feed instead of using the copy from the last few minutes")
 
-            if failed:
-                st.warning("Some episodes failed. See Recent events for per-episode error reasons (missing MP3 source, network timeout, or Drive permission expiry).")
+    if refresh_clicked:
+        fetch_feed_episodes.clear()
+    if check_clicked or refresh_clicked:
+        check_for_new_episodes(settings, downloaded_shiurim)
 
-            st.session_state.new_episodes = []
-            st.session_state.selected_episodes = {}
-            st.session_state.feed_checked = False
+    if st.session_state.feed_checked and st.session_state.new_episodes:
+        render_episode_picker(settings, downloaded_shiurim)
 
     elif st.session_state.feed_checked and not st.session_state.new_episodes:
         st.info("You're all caught up. No new episodes to download right now.")
@@ -554,7 +751,24 @@ def main():
 
     st.markdown("</div>", unsafe_allow_html=True)
 
-    # View uploaded shiurim
+
+def render_shiur_id_grid(shiur_ids):
+    """Show shiur IDs, newest first, spread over five columns."""
+    shiur_list = sorted(list(shiur_ids), reverse=True)
+
+    # One caption per column rather than one element per ID
+    cols = st.columns(5)
+    for col_idx, col in enumerate(cols):
+        column_ids = shiur_list[col_idx::5]
+        if column_ids:
+            col.caption("  \n".join(column_ids))
+
+
+def render_history(settings, downloaded_shiurim):
+    """Render the uploaded / downloaded shiurim history."""
+    feed_name = settings['feed_name']
+    drive_base_folder = settings['drive_base_folder']
+
     st.markdown("<div class='section-card'>", unsafe_allow_html=True)
     st.subheader("History")
     with st.expander("View uploaded shiurim", expanded=True):
@@ -563,26 +777,13 @@ def main():
             st.info("Checking Google Drive for uploaded shiurim...")
 
             # Find the folder to check
-            base_folder_id = gd.find_or_create_folder(drive_base_folder)
+            base_folder_id, check_folder_id = resolve_drive_folders(settings)
             if base_folder_id:
-                if use_subfolders:
-                    safe_feed_name = sanitize_filename(feed_name)
-                    check_folder_id = gd.find_or_create_folder(safe_feed_name, base_folder_id)
-                else:
-                    check_folder_id = base_folder_id
-
                 if check_folder_id:
                     uploaded_shiur_ids = gd.get_uploaded_shiur_ids(check_folder_id)
                     if uploaded_shiur_ids:
                         st.write(f"Total uploaded to `{feed_name}` folder: {len(uploaded_shiur_ids)}")
-                        shiur_list = sorted(list(uploaded_shiur_ids), reverse=True)
-
-                        # Show in columns
-                        cols = st.columns(5)
-                        for i, shiur_id in enumerate(shiur_list):
-                            col_idx = i % 5
-                            with cols[col_idx]:
-                                st.caption(shiur_id)
+                        render_shiur_id_grid(uploaded_shiur_ids)
                     else:
                         st.info("No shiurim uploaded to this folder yet")
                 else:
@@ -591,29 +792,62 @@ def main():
                 st.warning("Could not find/create base folder")
         else:
             # Fallback to local database
-            downloaded_shiurim = load_downloaded_shiurim(db_file)
             if downloaded_shiurim:
                 st.write(f"Total in local database: {len(downloaded_shiurim)}")
-                shiur_list = sorted(list(downloaded_shiurim), reverse=True)
-
-                # Show in columns
-                cols = st.columns(5)
-                for i, shiur_id in enumerate(shiur_list):
-                    col_idx = i % 5
-                    with cols[col_idx]:
-                        st.caption(shiur_id)
+                render_shiur_id_grid(downloaded_shiurim)
 
                 # Clear database option (only for local mode)
                 if st.button("Clear local database", type="secondary"):
                     if st.checkbox("Are you sure? This cannot be undone!"):
-                        save_downloaded_shiurim(db_file, set())
+                        save_downloaded_shiurim(settings['db_file'], set())
                         st.success("Database cleared")
                         st.rerun()
             else:
                 st.info("No saved history yet. Sign in to Google Drive to track uploads automatically.")
 
-
     st.markdown("</div>", unsafe_allow_html=True)
 
+
+def main():
+    st.set_page_config(
+        page_title="YUTorah Podcast Downloader",
+        page_icon="🎧",
+        layout="wide"
+    )
+
+    # Initialize cookie manager for persistent authentication
+    cookie_manager = cookies.CookieManager()
+    gd.set_cookie_manager(cookie_manager)
+
+    # Wait for cookie manager to be ready
+    if not cookie_manager.ready():
+        st.stop()
+
+    # Initialize authentication from cookies
+    gd.init_auth_from_cookies()
+
+    apply_custom_styles()
+
+    st.title("YUTorah Podcast Downloader")
+    st.caption("Download shiurim from YUTorah RSS feeds")
+
+    # Initialize session state
+    if 'new_episodes' not in st.session_state:
+        st.session_state.new_episodes = []
+    if 'selected_episodes' not in st.session_state:
+        st.session_state.selected_episodes = {}
+    if 'feed_checked' not in st.session_state:
+        st.session_state.feed_checked = False
+
+    settings = render_sidebar()
+
+    download_db = get_download_database(settings['db_file'])
+    downloaded_shiurim = download_db['downloaded_shiurim']
+
+    render_overview(settings, download_db)
+    render_downloads(settings, downloaded_shiurim)
+    render_history(settings, downloaded_shiurim)
+
+
 if __name__ == '__main__':
     main()
@@ -7,46 +7,225 @@ It parses the RSS feed, visits each episode page, and downloads the MP3 files.
 No login required - extracts download URLs from public page data.
 """
 
+import io
 import os
 import re
 import sys
 import time
+import threading
 import json
 import argparse
-import xml.etree.ElementTree as ET
+import shutil
+import tempfile
+from functools import lru_cache
 from pathlib import Path
-from urllib.parse import urljoin, urlparse, parse_qs
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qs
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
 
 # Default RSS feed URL
 DEFAULT_RSS_URL = "https://www.yutorah.org/rss/RssAudioOnly/teacher/80307"
 
+# Read size for streamed MP3 downloads
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Shiur ID patterns tried by extract_shiur_id after the query string
+SHIUR_ID_PATH_RE = re.compile(r'/lectures/(?:lecture\.cfm/|details/)?(\d+)')
+SHIUR_ID_LEGACY_RE = re.compile(r'shiurID[=:](\d+)')
+
+# Patterns used to pull episode data out of RSS text and lecture pages
+CDATA_RE = re.compile(r'<!\[CDATA\[(.*?)\]\]>')
+# Matches up to the opening brace; the object itself is read by the JSON decoder
+LECTURE_PLAYER_DATA_RE = re.compile(r'var\s+lecturePlayerData\s*=\s*(?=\{)')
+JSON_SCRIPT_BLOCK_RE = re.compile(
+    r'<script[^>]*?(?:id="([^"]+)")?[^>]*?type="application/json"[^>]*>(.*?)</script>',
+    re.DOTALL | re.IGNORECASE
+)
+DOWNLOAD_URL_KEY_RE = re.compile(r'downloadURL', re.IGNORECASE)
+SHIUR_ID_KEY_RE = re.compile(r'shiurID', re.IGNORECASE)
+AUDIO_FIELDS_BLOB_RE = re.compile(
+    r'\{[^{}]*?(?:downloadURL|playerDownloadURL|shiurID)[^{}]*?\}',
+    re.DOTALL | re.IGNORECASE
+)
+UNQUOTED_KEY_RE = re.compile(r'([,{]\s*)([A-Za-z_][A-Za-z0-9_]*)\s*:')
+MP3_URL_RE = re.compile(r'https?://[^"\'\s>]+\.mp3(?:\?[^"\'\s>]*)?', re.IGNORECASE)
+AUDIO_TAG_RE = re.compile(r'<audio\b', re.IGNORECASE)
+SOURCE_TAG_RE = re.compile(r'<source\b', re.IGNORECASE)
+# <audio> sources are preferred over <source> ones, double quotes over single
+MEDIA_SRC_RES = (
+    re.compile(r'<audio[^>]+src="([^"]+)"', re.IGNORECASE),
+    re.compile(r'<audio[^>]+src=\'([^\']+)\'', re.IGNORECASE),
+    re.compile(r'<source[^>]+src="([^"]+)"', re.IGNORECASE),
+    re.compile(r'<source[^>]+src=\'([^\']+)\'', re.IGNORECASE),
+)
+
+# Character fixes applied by sanitize_filename
+FILENAME_TRANSLATION = str.maketrans({
+    # All types of quotation marks become single quotes
+    '"': "'",        # ASCII double quote (U+0022)
+    '\u201c': "'",   # Left double quotation mark
+    '\u201d': "'",   # Right double quotation mark
+    '\u05f4': "'",   # Hebrew punctuation gershayim - looks like quotes
+    '\u201f': "'",   # Double high-reversed-9 quotation mark
+    '\u201e': "'",   # Double low-9 quotation mark
+    '\u00ab': "'",   # Left-pointing double angle quotation mark
+    '\u00bb': "'",   # Right-pointing double angle quotation mark
+    # Colons become dashes
+    ':': '-',
+    '\u05c3': '-',   # Hebrew punctuation sof pasuq - looks like a colon
+    # Windows-invalid characters are removed
+    **dict.fromkeys('<>/\\|?*'),
+})
+WHITESPACE_RUN_RE = re.compile(r'\s+')
+DASH_RUN_RE = re.compile(r'-+')
+
+# Hosts that serve everything over HTTPS; plain-HTTP links to them only
+# cost an extra redirect round-trip and a second connection
+HTTPS_HOSTS = ('yutorah.org', 'www.yutorah.org')
+
+# Kept-alive connections per host; enough for the app's parallel workers
+# to each hold one without opening and discarding extra connections
+HTTP_POOL_SIZE = 16
+
+# Transient gateway errors are retried quietly at the connection level;
+# the final response is still returned for callers to handle
+HTTP_RETRY = Retry(
+    total=2,
+    backoff_factor=0.5,
+    status_forcelist=(502, 503, 504),
+    raise_on_status=False,
+)
+
 # Session for HTTP requests
 session = requests.Session()
 session.headers.update({
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 })
+_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=HTTP_RETRY)
+session.mount('https://', _adapter)
+session.mount('http://', _adapter)
+
+# Session for the app's MP3 downloads, which retry in their own paced loop;
+# its adapter doesn't also retry 5xx responses underneath that loop
+mp3_session = requests.Session()
+mp3_session.headers.update(session.headers)
+_mp3_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+mp3_session.mount('https://', _mp3_adapter)
+mp3_session.mount('http://', _mp3_adapter)
+
+# ETag / Last-Modified of each feed's last fetch, for fetch_rss_feed(cache=...).
+# It lives here rather than in app.py, which Streamlit re-executes as a fresh
+# module on every rerun; as an imported module it is shared by all sessions
+# (feeds are public) so a refetch of an unchanged feed is a bodiless 304
+RSS_HTTP_CACHE = {}
+
+
+class RateLimiter:
+    """
+    Token bucket shared across threads.
 
+    Allows `rate` requests per second on average, with bursts of up to
+    `capacity` back-to-back requests. acquire() only sleeps once the bucket
+    is empty, so slow requests don't pay for the delay a second time.
+    """
 
-def load_downloaded_shiurim(db_file):
+    def __init__(self, rate, capacity=1):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            # Take a token now; a negative balance is the queue ahead of us
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def load_download_database(db_file):
     """
-    Load the set of already downloaded shiur IDs from JSON file.
+    Load the download database JSON file.
 
     Args:
         db_file: Path to the JSON database file
 
     Returns:
-        Set of downloaded shiur IDs
+        Dictionary with 'downloaded_shiurim' (set of shiur ID strings) and
+        'last_updated' (timestamp string, or None if never saved)
     """
     if os.path.exists(db_file):
         try:
             with open(db_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                return set(data.get('downloaded_shiurim', []))
+                return {
+                    # Hand-edited files may hold numbers; IDs are compared as strings
+                    'downloaded_shiurim': {str(x) for x in data.get('downloaded_shiurim', [])},
+                    'last_updated': data.get('last_updated'),
+                }
         except Exception as e:
             print(f"Warning: Could not load download database: {e}")
-            return set()
-    return set()
+    return {'downloaded_shiurim': set(), 'last_updated': None}
+
+
+def load_downloaded_shiurim(db_file):
+    """
+    Load the set of already downloaded shiur IDs from JSON file.
+
+    Args:
+        db_file: Path to the JSON database file
+
+    Returns:
+        Set of downloaded shiur IDs
+    """
+    return load_download_database(db_file)['downloaded_shiurim']
+
+
+# Mode for files write_json_atomic creates (mkstemp alone would leave them
+# 0600); existing files keep their own mode
+NEW_FILE_MODE = 0o644
+
+
+def write_json_atomic(path, data, indent=None):
+    """
+    Write JSON to a file so readers never see a half-written version.
+
+    The data goes to a temporary file in the same directory, which then
+    replaces the target in one step; a crash mid-write leaves the old file.
+
+    Args:
+        path: Destination file path
+        data: JSON-serializable data
+        indent: Optional indent for human-edited files
+    """
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        try:
+            f = os.fdopen(fd, 'w', encoding='utf-8')
+        except BaseException:
+            os.close(fd)
+            raise
+        with f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+        # mkstemp creates the file 0600 and os.replace would carry that over
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
 
 def save_downloaded_shiurim(db_file, downloaded_shiurim):
@@ -56,20 +235,46 @@ def save_downloaded_shiurim(db_file, downloaded_shiurim):
     Args:
         db_file: Path to the JSON database file
         downloaded_shiurim: Set of downloaded shiur IDs
+
+    Returns:
+        True if the database was written, False if the write failed
     """
     try:
-        with open(db_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'downloaded_shiurim': sorted(list(downloaded_shiurim)),
-                'last_updated': time.strftime('%Y-%m-%d %H:%M:%S')
-            }, f, indent=2)
+        # Machine-read only, so no indentation
+        write_json_atomic(db_file, {
+            'downloaded_shiurim': sorted(list(downloaded_shiurim)),
+            'last_updated': time.strftime('%Y-%m-%d %H:%M:%S')
+        })
     except Exception as e:
         print(f"Warning: Could not save download database: {e}")
+        return False
+    return True
+
+
+def prefer_https(url):
+    """
+    Upgrade plain-HTTP YUTorah URLs to HTTPS.
+
+    Keeps every request to the site on the same pooled keep-alive connection
+    instead of bouncing through an http -> https redirect first.
+
+    Args:
+        url: URL to normalize
+
+    Returns:
+        The URL, with its scheme upgraded if it points at a YUTorah host
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'http' and parsed.hostname in HTTPS_HOSTS:
+        return urlunparse(parsed._replace(scheme='https'))
+    return url
 
 
+@lru_cache(maxsize=4096)
 def extract_shiur_id(page_url):
     """
     Extract shiur ID from the episode page URL.
+    Results are memoized; a re-fetched feed mostly repeats the same links.
 
     Handles multiple URL formats:
     - https://www.yutorah.org/lectures/details?shiurID=1159876
@@ -93,56 +298,89 @@ def extract_shiur_id(page_url):
 
     # Format 2: In path - /lectures/1160274/ or /lectures/lecture.cfm/1160032
     # Look for a sequence of digits in the path
-    match = re.search(r'/lectures/(?:lecture\.cfm/|details/)?(\d+)', page_url)
+    match = SHIUR_ID_PATH_RE.search(page_url)
     if match:
         return match.group(1)
 
     # Format 3: shiurID in path or query (legacy fallback)
-    match = re.search(r'shiurID[=:](\d+)', page_url)
+    match = SHIUR_ID_LEGACY_RE.search(page_url)
     if match:
         return match.group(1)
 
     return None
 
 
-def fetch_rss_feed(rss_url):
+def fetch_rss_feed(rss_url, cache=None):
     """
-    Fetch and parse the RSS feed.
+    Fetch the RSS feed.
+
+    When a cache dict is supplied, the request is made conditional on the
+    ETag / Last-Modified of the previous fetch, and an unchanged feed (304)
+    is served from the cache without downloading it again.
 
     Args:
         rss_url: URL of the RSS feed
+        cache: Optional dict of rss_url -> {'etag', 'last_modified', 'content'},
+            updated in place
 
     Returns:
-        ElementTree root element
+        Raw feed XML as bytes, ready for extract_episode_links()
+
+    Raises:
+        requests.RequestException: If the feed can't be fetched
     """
     print(f"Fetching RSS feed from {rss_url}...")
-    try:
-        response = session.get(rss_url)
-        response.raise_for_status()
+    cached = cache.get(rss_url) if cache is not None else None
 
-        # Parse XML
-        root = ET.fromstring(response.content)
-        print(f"RSS feed fetched successfully")
-        return root
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
 
-    except Exception as e:
-        print(f"Error fetching RSS feed: {e}")
-        sys.exit(1)
+    response = session.get(prefer_https(rss_url), headers=headers, timeout=30)
+
+    if cached and response.status_code == 304:
+        print("RSS feed unchanged since last fetch")
+        return cached['content']
+
+    response.raise_for_status()
+
+    if cache is not None:
+        cache[rss_url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content': response.content,
+        }
+
+    print(f"RSS feed fetched successfully")
+    return response.content
 
 
-def extract_episode_links(rss_root):
+def extract_episode_links(rss_source):
     """
     Extract episode links from RSS feed.
 
+    Items are stream-parsed with lxml's iterparse and discarded once read, so
+    memory stays flat however many episodes the feed carries.
+
     Args:
-        rss_root: ElementTree root element
+        rss_source: Raw feed XML as bytes, or a path / file object to read it from
 
     Returns:
-        List of tuples (title, link)
+        List of tuples (title, link, shiur_id); shiur_id is None when the
+        link doesn't carry one
+
+    Raises:
+        etree.XMLSyntaxError: If the feed is malformed or truncated
     """
+    if isinstance(rss_source, (bytes, bytearray)):
+        rss_source = io.BytesIO(rss_source)
+
     episodes = []
 
-    for item in rss_root.findall('.//item'):
+    for _, item in etree.iterparse(rss_source, tag='item', resolve_entities=False):
         title_elem = item.find('title')
         link_elem = item.find('link')
 
@@ -152,11 +390,16 @@ def extract_episode_links(rss_root):
             link_text = link_elem.text or ''
 
             # Remove CDATA markers if present
-            title = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', title_text).strip()
-            link = re.sub(r'<!\[CDATA\[(.*?)\]\]>', r'\1', link_text).strip()
+            title = CDATA_RE.sub(r'\1', title_text).strip()
+            link = CDATA_RE.sub(r'\1', link_text).strip()
 
             if link:
-                episodes.append((title, link))
+                episodes.append((title, link, extract_shiur_id(link)))
+
+        # Free this item and any already-processed siblings
+        item.clear()
+        while item.getprevious() is not None:
+            del item.getparent()[0]
 
     print(f"Found {len(episodes)} episodes in RSS feed")
     return episodes
@@ -178,7 +421,7 @@ def get_mp3_url_from_page(page_url):
         Includes '_parser_meta' with extraction details and failure reasons.
     """
     try:
-        response = session.get(page_url, timeout=20)
+        response = session.get(prefer_https(page_url), timeout=20)
         response.raise_for_status()
         html_content = response.text
     except Exception as e:
@@ -230,9 +473,8 @@ def get_mp3_url_from_page(page_url):
 
 def _extract_json_script_blocks(html_content):
     """Extract inline JSON from <script> tags, including __NEXT_DATA__ payloads."""
-    pattern = r'<script[^>]*?(?:id="([^"]+)")?[^>]*?type="application/json"[^>]*>(.*?)</script>'
     script_blocks = []
-    for script_id, script_body in re.findall(pattern, html_content, re.DOTALL | re.IGNORECASE):
+    for script_id, script_body in JSON_SCRIPT_BLOCK_RE.findall(html_content):
         text = script_body.strip()
         if text:
             script_blocks.append({'id': script_id, 'text': text})
@@ -274,8 +516,7 @@ def _walk_for_audio_fields(data, results):
 
 def _extract_from_lecture_player_data(html_content):
     """Strategy A: parse legacy lecturePlayerData payload."""
-    pattern = r'var\s+lecturePlayerData\s*=\s*(\{.*?\});'
-    match = re.search(pattern, html_content, re.DOTALL)
+    match = LECTURE_PLAYER_DATA_RE.search(html_content)
     markers = {
         'lecturePlayerData_found': bool(match),
     }
@@ -284,7 +525,9 @@ def _extract_from_lecture_player_data(html_content):
         return None, markers
 
     try:
-        data = json.loads(match.group(1))
+        # raw_decode stops at the object's own closing brace, so '};' inside
+        # a string value no longer cuts the payload short
+        data, _ = json.JSONDecoder().raw_decode(html_content, match.end())
     except json.JSONDecodeError as e:
         markers['json_error'] = str(e)
         return None, markers
@@ -328,13 +571,13 @@ def _extract_from_next_data(html_content):
 def _extract_from_script_blobs(html_content):
     """Strategy C: parse script/json blobs for known keys and MP3 URL patterns."""
     markers = {
-        'downloadURL_key_mentions': len(re.findall(r'downloadURL', html_content, re.IGNORECASE)),
-        'shiurID_key_mentions': len(re.findall(r'shiurID', html_content, re.IGNORECASE)),
+        'downloadURL_key_mentions': len(DOWNLOAD_URL_KEY_RE.findall(html_content)),
+        'shiurID_key_mentions': len(SHIUR_ID_KEY_RE.findall(html_content)),
     }
 
-    snippets = re.findall(r'\{[^{}]*?(?:downloadURL|playerDownloadURL|shiurID)[^{}]*?\}', html_content, re.DOTALL | re.IGNORECASE)
+    snippets = AUDIO_FIELDS_BLOB_RE.findall(html_content)
     for snippet in snippets[:30]:
-        cleaned = re.sub(r'([,{]\s*)([A-Za-z_][A-Za-z0-9_]*)\s*:', r'\1"\2":', snippet)
+        cleaned = UNQUOTED_KEY_RE.sub(r'\1"\2":', snippet)
         cleaned = cleaned.replace("'", '"')
         try:
             candidate = json.loads(cleaned)
@@ -345,7 +588,7 @@ def _extract_from_script_blobs(html_content):
         except Exception:
             continue
 
-    mp3_matches = re.findall(r'https?://[^"\'\s>]+\.mp3(?:\?[^"\'\s>]*)?', html_content, re.IGNORECASE)
+    mp3_matches = MP3_URL_RE.findall(html_content)
     if mp3_matches:
         markers['mp3_match_count'] = len(mp3_matches)
         return {'downloadURL': mp3_matches[0], 'playerDownloadURL': mp3_matches[0]}, markers
@@ -356,15 +599,13 @@ def _extract_from_script_blobs(html_content):
 def _extract_from_audio_tags(html_content):
     """Strategy D: parse <audio> and <source> tags for MP3 sources."""
     markers = {
-        'audio_tag_count': len(re.findall(r'<audio\b', html_content, re.IGNORECASE)),
-        'source_tag_count': len(re.findall(r'<source\b', html_content, re.IGNORECASE)),
+        'audio_tag_count': len(AUDIO_TAG_RE.findall(html_content)),
+        'source_tag_count': len(SOURCE_TAG_RE.findall(html_content)),
     }
 
     candidates = []
-    candidates.extend(re.findall(r'<audio[^>]+src="([^"]+)"', html_content, re.IGNORECASE))
-    candidates.extend(re.findall(r'<audio[^>]+src=\'([^\']+)\'', html_content, re.IGNORECASE))
-    candidates.extend(re.findall(r'<source[^>]+src="([^"]+)"', html_content, re.IGNORECASE))
-    candidates.extend(re.findall(r'<source[^>]+src=\'([^\']+)\'', html_content, re.IGNORECASE))
+    for pattern in MEDIA_SRC_RES:
+        candidates.extend(pattern.findall(html_content))
 
     for url in candidates:
         if '.mp3' in url.lower():
@@ -399,10 +640,12 @@ def _normalize_episode_data(data, page_url):
     return normalized
 
 
+@lru_cache(maxsize=1024)
 def sanitize_filename(filename):
     """
     Sanitize filename to remove invalid characters for Windows/Unix filesystems.
     Handles Hebrew characters, special punctuation, and ensures cross-platform compatibility.
+    Results are memoized, since the same feed names and titles recur across reruns.
 
     Args:
         filename: Original filename
@@ -410,32 +653,13 @@ def sanitize_filename(filename):
     Returns:
         Sanitized filename safe for all filesystems
     """
-    # First, replace all types of quotation marks with single quotes
-    # This includes: ASCII quotes, smart quotes, Hebrew quotes, etc.
-    quote_chars = [
-        '"',   # ASCII double quote (U+0022)
-        '"',   # Left double quotation mark (U+201C)
-        '"',   # Right double quotation mark (U+201D)
-        '״',   # Hebrew punctuation gershayim (U+05F4) - looks like quotes
-        '‟',   # Double high-reversed-9 quotation mark (U+201F)
-        '„',   # Double low-9 quotation mark (U+201E)
-        '«',   # Left-pointing double angle quotation mark (U+00AB)
-        '»',   # Right-pointing double angle quotation mark (U+00BB)
-    ]
-    for quote in quote_chars:
-        filename = filename.replace(quote, "'")
-
-    # Replace colons with dashes (including special Unicode colons)
-    filename = filename.replace(':', '-')  # ASCII colon
-    filename = filename.replace('׃', '-')  # Hebrew punctuation sof pasuq (looks like colon)
-
-    # Remove Windows-invalid characters: < > / \ | ? *
-    # Use a more comprehensive regex that catches all variations
-    filename = re.sub(r'[<>/\\|?*]', '', filename)
+    # Map quotation marks to single quotes and colons to dashes, and drop
+    # Windows-invalid characters, in one pass
+    filename = filename.translate(FILENAME_TRANSLATION)
 
     # Replace multiple spaces/dashes with single ones
-    filename = re.sub(r'\s+', ' ', filename)
-    filename = re.sub(r'-+', '-', filename)
+    filename = WHITESPACE_RUN_RE.sub(' ', filename)
+    filename = DASH_RUN_RE.sub('-', filename)
 
     # Remove leading/trailing spaces, periods, and dashes (Windows doesn't allow these)
     filename = filename.strip('. -')
@@ -499,10 +723,12 @@ def download_mp3(mp3_url, title, output_dir):
 
         with open(filepath, 'wb') as f:
             if total_size == 0:
-                f.write(response.content)
+                # No length to report progress against; copy straight to disk
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
             else:
                 downloaded = 0
-                for chunk in response.iter_content(chunk_size=8192):
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                     if chunk:
                         f.write(chunk)
                         downloaded += len(chunk)
@@ -552,7 +778,7 @@ def main():
         '--delay',
         type=float,
         default=1.0,
-        help='Delay between downloads in seconds (default: 1.0)'
+        help='Minimum seconds between the start of consecutive downloads (default: 1.0)'
     )
     parser.add_argument(
         '--db-file',
@@ -587,25 +813,30 @@ def main():
     # Fetch RSS feed
     if args.rss_file:
         print(f"Reading RSS feed from local file: {args.rss_file}")
-        with open(args.rss_file, 'r', encoding='utf-8') as f:
-            rss_root = ET.fromstring(f.read())
+        rss_source = args.rss_file
     else:
-        rss_root = fetch_rss_feed(args.rss_url)
+        try:
+            rss_source = fetch_rss_feed(args.rss_url)
+        except requests.RequestException as e:
+            print(f"Error fetching RSS feed: {e}")
+            sys.exit(1)
 
     # Extract episode links
-    episodes = extract_episode_links(rss_root)
+    try:
+        episodes = extract_episode_links(rss_source)
+    except etree.XMLSyntaxError as e:
+        print(f"Error parsing RSS feed: {e}")
+        sys.exit(1)
 
     if not episodes:
         print("No episodes found in RSS feed")
         sys.exit(1)
 
     # Filter out already downloaded episodes
-    new_episodes = []
-    for title, page_url in episodes:
-        shiur_id = extract_shiur_id(page_url)
-        if shiur_id and shiur_id in downloaded_shiurim:
-            continue  # Skip already downloaded
-        new_episodes.append((title, page_url, shiur_id))
+    new_episodes = [
+        episode for episode in episodes
+        if not (episode[2] and episode[2] in downloaded_shiurim)
+    ]
 
     print(f"Found {len(episodes)} total episodes, {len(new_episodes)} new episodes to download")
 
@@ -626,39 +857,50 @@ def main():
     successful = 0
     failed = 0
 
-    for i, (title, page_url, shiur_id) in enumerate(new_episodes, 1):
-        print(f"[{i}/{len(new_episodes)}] {title}")
-        print(f"  Page: {page_url}")
-        if shiur_id:
-            print(f"  Shiur ID: {shiur_id}")
-
-        # Get MP3 URL from page
-        episode_data = get_mp3_url_from_page(page_url)
+    new_ids = 0
 
-        if not episode_data or not episode_data.get('downloadURL'):
-            print("  Failed: Could not find MP3 download link")
-            failed += 1
-        else:
-            mp3_url = episode_data['downloadURL']
-            if episode_data.get('duration'):
-                print(f"  Duration: {episode_data['duration']}")
-            print(f"  MP3 URL: {mp3_url}")
-
-            # Download the MP3
-            if download_mp3(mp3_url, title, output_dir):
-                successful += 1
-                # Mark as downloaded
-                if shiur_id:
-                    downloaded_shiurim.add(shiur_id)
-                    save_downloaded_shiurim(args.db_file, downloaded_shiurim)
-            else:
+    # Write the database once at the end, even if the run is interrupted
+    try:
+        next_request_at = time.monotonic()
+        for i, (title, page_url, shiur_id) in enumerate(new_episodes, 1):
+            # Space episode starts `delay` seconds apart; time already spent
+            # downloading the previous episode counts towards the wait
+            wait = next_request_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_request_at = time.monotonic() + args.delay
+
+            print(f"[{i}/{len(new_episodes)}] {title}")
+            print(f"  Page: {page_url}")
+            if shiur_id:
+                print(f"  Shiur ID: {shiur_id}")
+
+            # Get MP3 URL from page
+            episode_data = get_mp3_url_from_page(page_url)
+
+            if not episode_data or not episode_data.get('downloadURL'):
+                print("  Failed: Could not find MP3 download link")
                 failed += 1
-
-        print()
-
-        # Delay between requests to be polite
-        if i < len(new_episodes):
-            time.sleep(args.delay)
+            else:
+                mp3_url = episode_data['downloadURL']
+                if episode_data.get('duration'):
+                    print(f"  Duration: {episode_data['duration']}")
+                print(f"  MP3 URL: {mp3_url}")
+
+                # Download the MP3
+                if download_mp3(mp3_url, title, output_dir):
+                    successful += 1
+                    # Mark as downloaded
+                    if shiur_id and shiur_id not in downloaded_shiurim:
+                        downloaded_shiurim.add(shiur_id)
+                        new_ids += 1
+                else:
+                    failed += 1
+
+            print()
+    finally:
+        if new_ids:
+            save_downloaded_shiurim(args.db_file, downloaded_shiurim)
 
     # Summary
     print("=" * 80)
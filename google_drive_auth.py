@@ -7,20 +7,51 @@ Handles OAuth2 authentication for Google Drive and file uploads.
 
 import os
 import io
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 import streamlit as st
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+from googleapiclient.http import MediaIoBaseUpload, MediaUpload
 import json
 
 
 # Google OAuth2 settings
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Seconds a folder's uploaded shiur IDs are reused before listing Drive again
+UPLOADED_IDS_CACHE_TTL = 300
+
+# Overlap between incremental listings, to allow for clock drift with Drive
+LISTING_CLOCK_SKEW = timedelta(minutes=2)
+
+# Largest page files.list will return, so big folders need few round-trips
+LIST_PAGE_SIZE = 1000
+
+# Resumable upload chunk size (Drive requires a multiple of 256 KiB); this is
+# also the most a streamed upload holds in memory at once
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Streams of known length up to this size go up in a single multipart
+# request instead of opening a resumable session first
+SINGLE_REQUEST_UPLOAD_MAX = 5 * 1024 * 1024
+
+# Times a failed upload chunk (5xx, 429, connection error) is re-sent
+UPLOAD_NUM_RETRIES = 5
+
+# appProperties key uploads are stamped with; older uploads only carry
+# the shiur ID in their description
+SHIUR_ID_PROPERTY = 'shiurID'
+
 # Cookie manager will be set by app.py
 _cookie_manager = None
 
+# Drive service objects sit on httplib2, which is not thread-safe, so each
+# thread keeps its own service built from the session's credentials
+_thread_local = threading.local()
+
 
 def set_cookie_manager(cookie_manager):
     """
@@ -209,15 +240,25 @@ def get_drive_service():
     """
     Get an authenticated Google Drive service.
 
+    The service is built once per thread and reused until the session's
+    credentials change.
+
     Returns:
         Google Drive service object or None
     """
     if 'google_credentials' not in st.session_state:
         return None
 
+    creds_dict = st.session_state.google_credentials
+    cache_key = (creds_dict.get('client_id'), creds_dict.get('refresh_token'), creds_dict.get('token'))
+    cached = getattr(_thread_local, 'drive_service', None)
+    if cached and cached[0] == cache_key:
+        return cached[1]
+
     try:
-        credentials = dict_to_credentials(st.session_state.google_credentials)
+        credentials = dict_to_credentials(creds_dict)
         service = build('drive', 'v3', credentials=credentials)
+        _thread_local.drive_service = (cache_key, service)
         return service
     except Exception as e:
         st.error(f"Error creating Drive service: {e}")
@@ -278,10 +319,48 @@ def create_folder(folder_name, parent_folder_id=None):
         return None
 
 
+def _folder_id_cache():
+    """Per-session cache of (folder name, parent ID) -> folder ID."""
+    return st.session_state.setdefault('folder_id_cache', {})
+
+
+def _listed_parent_ids():
+    """Parent folder IDs whose subfolders are all in _folder_id_cache()."""
+    return st.session_state.setdefault('listed_parent_folder_ids', set())
+
+
+def _cache_subfolders(service, parent_folder_id):
+    """List every subfolder of a parent in one query and cache their IDs."""
+    cache = _folder_id_cache()
+    page_token = None
+
+    while True:
+        results = service.files().list(
+            q=f"'{parent_folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
+            spaces='drive',
+            fields='nextPageToken, files(id, name)',
+            pageToken=page_token,
+            pageSize=LIST_PAGE_SIZE
+        ).execute()
+
+        for f in results.get('files', []):
+            cache.setdefault((f['name'], parent_folder_id), f['id'])
+        page_token = results.get('nextPageToken')
+
+        if not page_token:
+            break
+
+    _listed_parent_ids().add(parent_folder_id)
+
+
 def find_or_create_folder(folder_name, parent_folder_id=None):
     """
     Find existing folder or create new one.
 
+    Resolved IDs are cached for the session, so each folder costs one
+    Drive lookup rather than one per rerun. Within a parent folder the
+    first lookup lists all subfolders, so switching feeds costs nothing.
+
     Args:
         folder_name: Name of the folder
         parent_folder_id: ID of parent folder (None for root)
@@ -289,43 +368,121 @@ def find_or_create_folder(folder_name, parent_folder_id=None):
     Returns:
         Folder ID or None
     """
+    cache = _folder_id_cache()
+    key = (folder_name, parent_folder_id)
+    if key in cache:
+        return cache[key]
+
     service = get_drive_service()
     if not service:
         return None
 
     try:
-        # Search for existing folder
-        query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        if parent_folder_id:
-            query += f" and '{parent_folder_id}' in parents"
-
-        results = service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
+        folder_id = None
+        listed_now = False
+        if parent_folder_id and parent_folder_id not in _listed_parent_ids():
+            _cache_subfolders(service, parent_folder_id)
+            folder_id = cache.get(key)
+            listed_now = True
+
+        if not folder_id and not listed_now:
+            # The folder may have been created since the parent was listed
+            # (e.g. in another tab), so look it up before creating a duplicate.
+            # Quotes in names must be escaped.
+            escaped_name = folder_name.replace('\\', '\\\\').replace("'", "\\'")
+            query = f"name='{escaped_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+            if parent_folder_id:
+                query += f" and '{parent_folder_id}' in parents"
+            results = service.files().list(
+                q=query,
+                spaces='drive',
+                fields='files(id, name)'
+            ).execute()
 
-        files = results.get('files', [])
+            files = results.get('files', [])
+            folder_id = files[0]['id'] if files else None
 
-        if files:
-            return files[0]['id']
-        else:
-            return create_folder(folder_name, parent_folder_id)
+        if not folder_id:
+            folder_id = create_folder(folder_name, parent_folder_id)
     except Exception as e:
         st.error(f"Error finding/creating folder: {e}")
         return None
 
+    if folder_id:
+        cache[key] = folder_id
+    return folder_id
+
+
+class StreamingMediaUpload(MediaUpload):
+    """
+    Resumable media upload that reads from a non-seekable stream.
+
+    MediaIoBaseUpload seeks to the end of its file object to learn the size,
+    which rules out feeding it an HTTP response body. This reads the stream
+    sequentially one chunk at a time, keeping only the current chunk in
+    memory so a retried chunk can be re-sent.
+
+    When the stream's length is known it is declared up front, and small
+    streams are sent in one request rather than through a resumable session.
+    """
+
+    def __init__(self, stream, mimetype, chunksize=UPLOAD_CHUNK_SIZE, size=None):
+        super().__init__()
+        self._stream = stream
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._size = size
+        self._offset = 0
+        self._buffer = b''
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        # None means unknown until the stream is exhausted; a short read marks the end
+        return self._size
+
+    def resumable(self):
+        return self._size is None or self._size > SINGLE_REQUEST_UPLOAD_MAX
+
+    def getbytes(self, begin, length):
+        if begin < self._offset:
+            raise ValueError(f"Cannot rewind stream to byte {begin} (at {self._offset})")
+
+        # Drop bytes Drive has acknowledged, keep the rest for re-sending
+        self._buffer = self._buffer[begin - self._offset:]
+        self._offset = begin
+
+        while len(self._buffer) < length:
+            data = self._stream.read(length - len(self._buffer))
+            if not data:
+                break
+            self._buffer += data
+
+        return self._buffer[:length]
+
+    def has_stream(self):
+        return False
+
 
-def upload_file_to_drive(file_content, filename, folder_id=None, mime_type='audio/mpeg', description=None):
+def upload_file_to_drive(file_content, filename, folder_id=None, mime_type='audio/mpeg', description=None, size=None,
+                         app_properties=None):
     """
     Upload a file to Google Drive.
 
     Args:
-        file_content: File content as bytes
+        file_content: File content as bytes, or a readable stream (e.g. an
+            HTTP response body) which is uploaded in chunks without buffering
         filename: Name for the file
         folder_id: ID of folder to upload to (None for root)
         mime_type: MIME type of the file
         description: Optional description (used to store shiur ID for tracking)
+        size: Length in bytes of a streamed file_content, if known
+        app_properties: Optional dict of private key/value properties,
+            e.g. {SHIUR_ID_PROPERTY: shiur_id}
 
     Returns:
         File info dict or None
@@ -344,18 +501,25 @@ def upload_file_to_drive(file_content, filename, folder_id=None, mime_type='audi
     if description:
         file_metadata['description'] = description
 
+    if app_properties:
+        file_metadata['appProperties'] = app_properties
+
     try:
-        media = MediaIoBaseUpload(
-            io.BytesIO(file_content),
-            mimetype=mime_type,
-            resumable=True
-        )
+        if isinstance(file_content, (bytes, bytearray)):
+            media = MediaIoBaseUpload(
+                io.BytesIO(file_content),
+                mimetype=mime_type,
+                chunksize=UPLOAD_CHUNK_SIZE,
+                resumable=True
+            )
+        else:
+            media = StreamingMediaUpload(file_content, mime_type, size=size)
 
         file = service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id, name, webViewLink, description'
-        ).execute()
+        ).execute(num_retries=UPLOAD_NUM_RETRIES)
 
         return file
     except Exception as e:
@@ -404,42 +568,67 @@ def list_files_in_folder(folder_id):
         folder_id: ID of the folder to list files from
 
     Returns:
-        List of file dictionaries with 'id', 'name', 'description' fields
+        List of file dictionaries with 'id', 'name', 'description' and
+        'appProperties' fields
+    """
+    try:
+        return _list_files_in_folder(folder_id)
+    except Exception as e:
+        print(f"Error listing files: {e}")
+        return []
+
+
+def _list_files_in_folder(folder_id, created_after=None, file_fields='id, name, description, appProperties'):
+    """
+    list_files_in_folder() without the error handling; raises on API errors.
+
+    `created_after` (an RFC 3339 UTC timestamp) limits the listing to newer
+    files and `file_fields` narrows the per-file fields Drive returns.
     """
     service = get_drive_service()
     if not service:
-        return []
+        raise RuntimeError("Not signed in to Google Drive")
 
-    try:
-        query = f"'{folder_id}' in parents and trashed=false"
-        all_files = []
-        page_token = None
+    query = f"'{folder_id}' in parents and trashed=false"
+    if created_after:
+        query += f" and createdTime > '{created_after}'"
 
-        while True:
-            results = service.files().list(
-                q=query,
-                spaces='drive',
-                fields='nextPageToken, files(id, name, description)',
-                pageToken=page_token,
-                pageSize=100
-            ).execute()
+    all_files = []
+    page_token = None
+
+    while True:
+        results = service.files().list(
+            q=query,
+            spaces='drive',
+            fields=f'nextPageToken, files({file_fields})',
+            pageToken=page_token,
+            pageSize=LIST_PAGE_SIZE
+        ).execute()
 
-            all_files.extend(results.get('files', []))
-            page_token = results.get('nextPageToken')
+        all_files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
 
-            if not page_token:
-                break
+        if not page_token:
+            break
 
-        return all_files
-    except Exception as e:
-        print(f"Error listing files: {e}")
-        return []
+    return all_files
+
+
+def _uploaded_ids_cache():
+    """Per-session cache of folder ID -> {'ids', 'checked_at', 'listed_at'}."""
+    return st.session_state.setdefault('uploaded_shiur_ids_cache', {})
 
 
 def get_uploaded_shiur_ids(folder_id):
     """
     Get set of shiur IDs that have already been uploaded to a folder.
-    Extracts shiur IDs from file descriptions (where we store them).
+    Reads each file's shiurID appProperty, or its description for older uploads.
+
+    Results are cached per folder for UPLOADED_IDS_CACHE_TTL seconds so
+    reruns don't page through the folder listing again. Once the cache
+    expires only files created since the previous listing are fetched and
+    merged in; files removed from Drive drop out once the cache is cleared
+    with clear_uploaded_shiur_ids_cache().
 
     Args:
         folder_id: ID of the folder to check
@@ -447,18 +636,64 @@ def get_uploaded_shiur_ids(folder_id):
     Returns:
         Set of shiur ID strings
     """
-    files = list_files_in_folder(folder_id)
-    shiur_ids = set()
+    cache = _uploaded_ids_cache()
+    cached = cache.get(folder_id)
+    if cached and time.monotonic() - cached['checked_at'] < UPLOADED_IDS_CACHE_TTL:
+        return set(cached['ids'])
+
+    incremental = cached is not None
+    listed_at = datetime.now(timezone.utc) - LISTING_CLOCK_SKEW
+
+    try:
+        # Only the fields that carry the shiur ID, to keep large listings small
+        files = _list_files_in_folder(
+            folder_id,
+            cached['listed_at'] if incremental else None,
+            file_fields='description, appProperties'
+        )
+    except Exception as e:
+        print(f"Error listing files: {e}")
+        return set(cached['ids']) if cached else set()
+
+    shiur_ids = set(cached['ids']) if incremental else set()
 
     for f in files:
-        # Check description for shiur ID
-        desc = f.get('description', '')
-        if desc and desc.startswith('shiurID:'):
-            shiur_id = desc.replace('shiurID:', '').strip()
-            if shiur_id:
-                shiur_ids.add(shiur_id)
+        shiur_id = (f.get('appProperties') or {}).get(SHIUR_ID_PROPERTY)
+        if not shiur_id:
+            # Fall back to the description for files uploaded before
+            # appProperties were set
+            desc = f.get('description', '')
+            if desc and desc.startswith('shiurID:'):
+                shiur_id = desc.replace('shiurID:', '').strip()
+        if shiur_id:
+            shiur_ids.add(shiur_id)
+
+    cache[folder_id] = {
+        'ids': shiur_ids,
+        'checked_at': time.monotonic(),
+        'listed_at': listed_at.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    return set(shiur_ids)
+
+
+def record_uploaded_shiur_id(folder_id, shiur_id):
+    """
+    Add a freshly uploaded shiur ID to the folder's cached set, if any.
+
+    Args:
+        folder_id: ID of the folder the file was uploaded to
+        shiur_id: Shiur ID stored in the uploaded file's description
+    """
+    cached = _uploaded_ids_cache().get(folder_id)
+    if cached:
+        cached['ids'].add(str(shiur_id))
+
 
-    return shiur_ids
+def clear_uploaded_shiur_ids_cache():
+    """Forget cached folder IDs and listings so the next check re-lists Drive."""
+    _folder_id_cache().clear()
+    _listed_parent_ids().clear()
+    _uploaded_ids_cache().clear()
 
 
 def sign_out():
@@ -472,6 +707,12 @@ def sign_out():
         del st.session_state.google_authenticated
     if 'oauth_state' in st.session_state:
         del st.session_state.oauth_state
+    if 'uploaded_shiur_ids_cache' in st.session_state:
+        del st.session_state.uploaded_shiur_ids_cache
+    if 'folder_id_cache' in st.session_state:
+        del st.session_state.folder_id_cache
+    if 'listed_parent_folder_ids' in st.session_state:
+        del st.session_state.listed_parent_folder_ids
 
     # Clear cookies
     if _cookie_manager is not None:
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the RateLimiter token bucket that paces requests to YUTorah.
+"""
+
+import pytest
+
+import download_podcasts
+from download_podcasts import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock; sleeps are recorded and advance it unless `frozen`."""
+    state = {'now': 100.0, 'sleeps': [], 'frozen': False}
+
+    def sleep(seconds):
+        state['sleeps'].append(seconds)
+        if not state['frozen']:
+            state['now'] += seconds
+
+    monkeypatch.setattr(download_podcasts.time, 'monotonic', lambda: state['now'])
+    monkeypatch.setattr(download_podcasts.time, 'sleep', sleep)
+    return state
+
+
+def test_burst_up_to_capacity_does_not_wait(clock):
+    limiter = RateLimiter(rate=1.0, capacity=3)
+
+    for _ in range(3):
+        limiter.acquire()
+
+    assert clock['sleeps'] == []
+
+
+def test_empty_bucket_waits_for_the_next_token(clock):
+    limiter = RateLimiter(rate=2.0, capacity=1)
+
+    limiter.acquire()
+    limiter.acquire()
+
+    assert clock['sleeps'] == [pytest.approx(0.5)]
+
+
+def test_tokens_refill_with_time_but_not_past_capacity(clock):
+    limiter = RateLimiter(rate=1.0, capacity=2)
+    limiter.acquire()
+    limiter.acquire()
+
+    clock['now'] += 60
+    for _ in range(3):
+        limiter.acquire()
+
+    assert clock['sleeps'] == [pytest.approx(1.0)]
+
+
+def test_slow_requests_do_not_pay_the_delay_again(clock):
+    limiter = RateLimiter(rate=1.0, capacity=1)
+
+    limiter.acquire()
+    clock['now'] += 1.5
+    limiter.acquire()
+
+    assert clock['sleeps'] == []
+
+
+def test_waiters_queue_behind_each_other(clock):
+    # Threads that take a token before the earlier sleepers wake each
+    # wait one interval longer than the one ahead of them
+    clock['frozen'] = True
+    limiter = RateLimiter(rate=1.0, capacity=1)
+
+    for _ in range(4):
+        limiter.acquire()
+
+    assert clock['sleeps'] == [pytest.approx(1.0), pytest.approx(2.0), pytest.approx(3.0)]
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Tests for the streamed Drive uploads and the cached shiur ID listing.
+
+Uploads run against googleapiclient's HttpMockSequence and the bundled
+Drive v3 discovery document, so no network or credentials are needed.
+"""
+
+import io
+import json
+
+import pytest
+import googleapiclient.http
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpMockSequence
+
+import google_drive_auth as gd
+
+
+MIB = 1024 * 1024
+UPLOAD_SESSION_URL = 'https://upload.example.com/session'
+CREATED_FILE = json.dumps({'id': 'file-1', 'name': 'shiur.mp3'})
+
+
+class ChunkedStream(io.RawIOBase):
+    """Non-seekable stream that returns at most `read_size` bytes per read, like an HTTP body."""
+
+    def __init__(self, data, read_size=64 * 1024):
+        self._data = data
+        self._pos = 0
+        self._read_size = read_size
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._data)
+        size = min(size, self._read_size)
+        chunk = self._data[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+def _payload(size):
+    return bytes(i % 251 for i in range(size))
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    """Point upload_file_to_drive at a Drive service answering from a canned response list."""
+    monkeypatch.setattr(googleapiclient.http.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(gd.st, 'error', lambda message: pytest.fail(message))
+
+    def install(responses):
+        http = HttpMockSequence(responses)
+        service = build('drive', 'v3', http=http, static_discovery=True)
+        monkeypatch.setattr(gd, 'get_drive_service', lambda: service)
+        return http
+
+    return install
+
+
+def _upload_requests(http):
+    """The (method, Content-Range, body) of each request after the session was opened."""
+    return [
+        (method, (headers or {}).get('Content-Range'), body)
+        for uri, method, body, headers in http.request_sequence
+        if uri == UPLOAD_SESSION_URL
+    ]
+
+
+def test_small_stream_of_known_size_is_one_multipart_request(drive):
+    data = _payload(1 * MIB)
+    http = drive([({'status': '200'}, CREATED_FILE)])
+
+    result = gd.upload_file_to_drive(ChunkedStream(data), 'shiur.mp3', size=len(data))
+
+    assert result['id'] == 'file-1'
+    assert len(http.request_sequence) == 1
+    uri, method, body, headers = http.request_sequence[0]
+    assert 'uploadType=multipart' in uri
+    assert data in body
+
+
+def test_stream_of_unknown_size_finishes_on_short_read(drive):
+    data = _payload(5 * MIB)
+    http = drive([
+        ({'status': '200', 'location': UPLOAD_SESSION_URL}, ''),
+        ({'status': '200'}, CREATED_FILE),
+    ])
+
+    result = gd.upload_file_to_drive(ChunkedStream(data), 'shiur.mp3')
+
+    assert result['id'] == 'file-1'
+    assert len(http.request_sequence) == 2
+    assert 'uploadType=resumable' in http.request_sequence[0][0]
+    [(method, content_range, body)] = _upload_requests(http)
+    assert content_range == f'bytes 0-{len(data) - 1}/{len(data)}'
+    assert body == data
+
+
+def test_large_stream_declares_its_size_and_uploads_in_chunks(drive):
+    data = _payload(9 * MIB)
+    chunk = gd.UPLOAD_CHUNK_SIZE
+    http = drive([
+        ({'status': '200', 'location': UPLOAD_SESSION_URL}, ''),
+        ({'status': '308', 'range': f'bytes=0-{chunk - 1}'}, ''),
+        ({'status': '200'}, CREATED_FILE),
+    ])
+
+    result = gd.upload_file_to_drive(ChunkedStream(data), 'shiur.mp3', size=len(data))
+
+    assert result['id'] == 'file-1'
+    assert len(http.request_sequence) == 3
+    init_headers = http.request_sequence[0][3]
+    assert init_headers['X-Upload-Content-Length'] == str(len(data))
+    assert _upload_requests(http) == [
+        ('PUT', f'bytes 0-{chunk - 1}/{len(data)}', data[:chunk]),
+        ('PUT', f'bytes {chunk}-{len(data) - 1}/{len(data)}', data[chunk:]),
+    ]
+
+
+def test_failed_chunk_is_resent_from_the_buffer(drive):
+    data = _payload(9 * MIB)
+    chunk = gd.UPLOAD_CHUNK_SIZE
+    http = drive([
+        ({'status': '200', 'location': UPLOAD_SESSION_URL}, ''),
+        ({'status': '308', 'range': f'bytes=0-{chunk - 1}'}, ''),
+        ({'status': '500'}, ''),
+        ({'status': '200'}, CREATED_FILE),
+    ])
+
+    result = gd.upload_file_to_drive(ChunkedStream(data), 'shiur.mp3', size=len(data))
+
+    assert result['id'] == 'file-1'
+    second, retried = _upload_requests(http)[1:]
+    assert second == retried == ('PUT', f'bytes {chunk}-{len(data) - 1}/{len(data)}', data[chunk:])
+
+
+def test_partly_acknowledged_chunk_resends_only_the_rest(drive):
+    data = _payload(9 * MIB)
+    acknowledged = 3 * MIB
+    http = drive([
+        ({'status': '200', 'location': UPLOAD_SESSION_URL}, ''),
+        ({'status': '308', 'range': f'bytes=0-{acknowledged - 1}'}, ''),
+        ({'status': '200'}, CREATED_FILE),
+    ])
+
+    result = gd.upload_file_to_drive(ChunkedStream(data), 'shiur.mp3', size=len(data))
+
+    assert result['id'] == 'file-1'
+    method, content_range, body = _upload_requests(http)[1]
+    assert content_range == f'bytes {acknowledged}-{len(data) - 1}/{len(data)}'
+    assert body == data[acknowledged:]
+
+
+def test_getbytes_cannot_rewind_past_acknowledged_bytes():
+    data = _payload(1000)
+    media = gd.StreamingMediaUpload(ChunkedStream(data, read_size=64), 'audio/mpeg', chunksize=256)
+
+    assert media.getbytes(0, 256) == data[:256]
+    assert media.getbytes(100, 256) == data[100:356]
+    with pytest.raises(ValueError):
+        media.getbytes(0, 256)
+
+
+@pytest.fixture
+def listing(monkeypatch):
+    """Fake folder listing with a controllable clock; records each created_after passed."""
+    cache = {}
+    clock = {'now': 1000.0}
+    state = {'files': [], 'calls': [], 'error': None}
+
+    def list_files(folder_id, created_after=None, file_fields=None):
+        state['calls'].append(created_after)
+        if state['error']:
+            raise state['error']
+        return state['files']
+
+    monkeypatch.setattr(gd, '_uploaded_ids_cache', lambda: cache)
+    monkeypatch.setattr(gd, '_list_files_in_folder', list_files)
+    monkeypatch.setattr(gd.time, 'monotonic', lambda: clock['now'])
+    state['clock'] = clock
+    state['cache'] = cache
+    return state
+
+
+def test_uploaded_ids_read_app_properties_and_legacy_descriptions(listing):
+    listing['files'] = [
+        {'appProperties': {gd.SHIUR_ID_PROPERTY: '101'}},
+        {'description': 'shiurID: 102'},
+        {'description': 'unrelated'},
+    ]
+
+    assert gd.get_uploaded_shiur_ids('folder') == {'101', '102'}
+    assert listing['calls'] == [None]
+
+
+def test_uploaded_ids_are_reused_within_the_ttl(listing):
+    listing['files'] = [{'appProperties': {gd.SHIUR_ID_PROPERTY: '101'}}]
+    gd.get_uploaded_shiur_ids('folder')
+
+    listing['clock']['now'] += gd.UPLOADED_IDS_CACHE_TTL - 1
+    assert gd.get_uploaded_shiur_ids('folder') == {'101'}
+    assert listing['calls'] == [None]
+
+
+def test_expired_ids_are_refreshed_incrementally_and_merged(listing):
+    listing['files'] = [{'appProperties': {gd.SHIUR_ID_PROPERTY: '101'}}]
+    gd.get_uploaded_shiur_ids('folder')
+    listed_at = listing['cache']['folder']['listed_at']
+
+    listing['clock']['now'] += gd.UPLOADED_IDS_CACHE_TTL + 1
+    listing['files'] = [{'appProperties': {gd.SHIUR_ID_PROPERTY: '102'}}]
+
+    assert gd.get_uploaded_shiur_ids('folder') == {'101', '102'}
+    assert listing['calls'] == [None, listed_at]
+
+
+def test_listing_error_falls_back_without_caching(listing):
+    listing['error'] = RuntimeError("Not signed in to Google Drive")
+
+    assert gd.get_uploaded_shiur_ids('folder') == set()
+    assert 'folder' not in listing['cache']
+
+    listing['error'] = None
+    listing['files'] = [{'appProperties': {gd.SHIUR_ID_PROPERTY: '101'}}]
+    assert gd.get_uploaded_shiur_ids('folder') == {'101'}
+    assert listing['calls'] == [None, None]
+
+
+def test_record_uploaded_shiur_id_updates_the_cached_set(listing):
+    gd.get_uploaded_shiur_ids('folder')
+    gd.record_uploaded_shiur_id('folder', '103')
+
+    assert gd.get_uploaded_shiur_ids('folder') == {'103'}